@@ -3,24 +3,37 @@ Task 2: Code Error Explanation Bot
 Objective: Build a bot that explains Python code errors without providing complete solutions
 """
 
+from __future__ import annotations
+
 import os
-import openai
-from typing import List, Dict
-import json
-from dotenv import load_dotenv
+import sys
+import time
+import hashlib
+import asyncio
+import contextlib
+import functools
+import importlib.util
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+import orjson
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 
-class CodeExplainerBot:
-    def __init__(self, api_key: str):
-        """
-        Initialize the code explanation bot
+if TYPE_CHECKING:
+    # openai is slow to import, so it is only imported where it is used
+    import openai
 
-        Parameters:
-        api_key: OpenAI API key
-        """
-        self.client = openai.OpenAI(api_key=api_key)
+# Larger files are skipped in batch processing rather than sent to the API
+MAX_SOURCE_BYTES = 32_768
+
+# Used when the account limits cannot be read from the API response headers
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 60000
 
-        # Prompt template for teaching assistant
-        self.system_prompt = """
+# Prompt template for teaching assistant. Kept as one constant so every request
+# starts with a byte-identical prefix that OpenAI's prompt caching can reuse.
+SYSTEM_PROMPT = """
 You are a Python programming teaching assistant. When students encounter code errors, you need to:
 
 1. Clearly explain the meaning of the error
@@ -31,129 +44,988 @@ You are a Python programming teaching assistant. When students encounter code er
 Important: Do not provide complete code solutions, but guide students to think and learn.
 """
 
-    def explain_error(self, error_code: str, error_message: str = "") -> str:
+# Answer structure requested for every explanation
+ANSWER_FORMAT = """
+## Error Analysis
+[Explain what the error is]
+
+## Cause
+[Explain why this error occurred]
+
+## Repair Suggestions
+[Provide conceptual repair methods, do not give complete code]
+
+## Learning Points
+[Relevant Python knowledge points]
+"""
+
+# Fixed parts of the single-file user prompt, joined around the code and error message
+_USER_PROMPT_HEAD = "\nPlease analyze the following Python code error:\n\nCode:\n```python\n"
+_USER_PROMPT_TAIL = "\n```\n\nError message (if any):\n"
+_FMT_BLOCK = "\n\nPlease answer in the following format:\n" + ANSWER_FORMAT
+
+def _is_transient_error(e: BaseException) -> bool:
+    """
+    Rate limits, dropped connections, timeouts and 5xx responses are worth retrying;
+    authentication and bad request errors are not
+    """
+    import openai
+
+    return isinstance(e, (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError
+    ))
+
+# Retry transient API failures with jittered exponential backoff
+_api_retry = retry(
+    retry=retry_if_exception(_is_transient_error),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(6),
+    reraise=True
+)
+
+@functools.lru_cache(maxsize=None)
+def _get_client(api_key: str) -> openai.OpenAI:
+    """
+    Return one shared OpenAI client per API key so keep-alive connections are reused
+    across bot instances
+    """
+    import httpx
+    import openai
+
+    http_client = httpx.Client(
+        # HTTP/2 needs the optional h2 package
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_keepalive_connections=50),
+        timeout=openai.DEFAULT_TIMEOUT
+    )
+    # Retries are handled by _api_retry only
+    return openai.OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+class APIErrorText(str):
+    """
+    Explanation text returned when the API call failed
+
+    Reads like any other explanation, but lets callers tell failures apart
+    with isinstance instead of matching on the message.
+    """
+
+    @classmethod
+    def from_exception(cls, e: BaseException) -> "APIErrorText":
+        return cls(f"API call error: {str(e)}")
+
+class CreditSemaphore:
+    """
+    Async semaphore where each acquisition spends credits that are refunded after a fixed time
+
+    Used to pace API calls to the requests-per-minute and tokens-per-minute limits
+    instead of running into RateLimitError.
+    """
+
+    def __init__(self, credits: int):
+        """
+        Parameters:
+        credits: Total number of credits available per refund window
+        """
+        self.credits = credits
+        self._available = credits
+        self._refunds = deque()  # (refund time, credits) in spending order
+
+    def _reclaim(self):
+        now = time.monotonic()
+        while self._refunds and self._refunds[0][0] <= now:
+            self._available += self._refunds.popleft()[1]
+
+    async def acquire(self, credits: int, refund_time: float):
+        """
+        Wait until enough credits are available, then spend them
+
+        Parameters:
+        credits: Credits to spend (capped at the total so large requests cannot wait forever)
+        refund_time: Seconds after which the credits become available again
+        """
+        credits = min(credits, self.credits)
+        while True:
+            self._reclaim()
+            if self._available >= credits:
+                self._available -= credits
+                self._refunds.append((time.monotonic() + refund_time, credits))
+                return
+            # Sleep until the oldest spend is refunded
+            await asyncio.sleep(max(self._refunds[0][0] - time.monotonic(), 0.01))
+
+    async def transact(self, factory, credits: int, refund_time: float):
+        """
+        Spend credits, then create the coroutine with the zero-argument factory and await it
+
+        The coroutine only exists once credits are granted, so cancelling a waiting
+        transaction leaves no un-awaited coroutine behind.
+        """
+        await self.acquire(credits, refund_time)
+        return await factory()
+
+class LLMCache:
+    """
+    Cache of model responses kept in memory and as text files on disk
+
+    Files are stored as <cache_dir>/<key[:2]>/<key>.txt to keep directories small.
+    """
+
+    def __init__(self, cache_dir: str = "data/.llm_cache"):
+        """
+        Parameters:
+        cache_dir: Directory where cached responses are stored
+        """
+        self.cache_dir = cache_dir
+        self._memory = {}
+
+    @staticmethod
+    def cache_key(payload: Dict) -> str:
+        """
+        Hash a request payload into a cache key
+        """
+        return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached response for the key, or None on a miss
+        """
+        if key in self._memory:
+            return self._memory[key]
+
+        try:
+            value = Path(self._path(key)).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+        self._memory[key] = value
+        return value
+
+    def set(self, key: str, value: str):
+        """
+        Store a response under the key
+        """
+        self._memory[key] = value
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file and move it into place, so an interrupted write
+        # never leaves a truncated entry that get() would serve as a hit
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            Path(tmp_path).write_text(value, encoding="utf-8")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+class SemanticCache:
+    """
+    Cache that returns the answer of the most similar earlier error
+
+    Texts are embedded with a local sentence-transformers model, so near-duplicate
+    errors (same problem, different variable names) reuse one explanation.
+    Entries are grouped by a namespace (model settings), so answers from one model
+    are never served for another. Requires numpy and sentence-transformers.
+    """
+
+    def __init__(self, cache_dir: str = "data/.llm_cache", threshold: float = 0.92,
+                 model_name: str = "all-MiniLM-L6-v2"):
+        """
+        Parameters:
+        cache_dir: Directory where the embedding indexes are stored
+        threshold: Minimum cosine similarity for a cache hit
+        model_name: sentence-transformers model used for embeddings
+        """
+        self.cache_dir = cache_dir
+        self.threshold = threshold
+        self.model_name = model_name
+        self._model = None
+        # namespace -> [(N, dim) array of normalized embeddings or None, list of N answers]
+        self._indexes = {}
+
+    def _files(self, namespace: str) -> Tuple[str, str]:
+        # Vectors from different embedding models (and dimensions) never share a file
+        embedder = hashlib.sha256(self.model_name.encode()).hexdigest()[:8]
+        base = os.path.join(self.cache_dir, f"semantic_{embedder}_{namespace}")
+        return base + ".f32", base + ".jsonl"
+
+    def _load(self, namespace: str) -> list:
+        """
+        Return the [index, answers] entry of the namespace, loading it from disk on first use
+
+        Vectors (raw float32) and answers (JSONL) are appended to separate files. A crash
+        between the two writes leaves one file an entry longer, so both are cut back to
+        the entries they have in common; if only one file exists, the namespace is empty.
+        """
+        # Heavy optional dependencies, only imported when the cache is used
+        import numpy as np
+
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+
+            self._model = SentenceTransformer(self.model_name)
+
+        if namespace in self._indexes:
+            return self._indexes[namespace]
+
+        index, answers = None, []
+        vectors_file, answers_file = self._files(namespace)
+        has_vectors, has_answers = os.path.exists(vectors_file), os.path.exists(answers_file)
+        if has_vectors != has_answers:
+            # A crash during the very first add: drop the orphan so later appends stay aligned
+            os.remove(vectors_file if has_vectors else answers_file)
+        elif has_vectors:
+            dim = self._model.get_sentence_embedding_dimension()
+            vectors = np.fromfile(vectors_file, dtype=np.float32)
+            vectors = vectors[:len(vectors) // dim * dim].reshape(-1, dim)
+
+            ends = []  # byte offset after each complete answer line
+            offset = 0
+            for line in Path(answers_file).read_bytes().splitlines(keepends=True):
+                try:
+                    answers.append(orjson.loads(line))
+                except ValueError:
+                    break
+                offset += len(line)
+                ends.append(offset)
+
+            n = min(len(vectors), len(answers))
+            answers = answers[:n]
+            if n:
+                index = vectors[:n]
+            # Drop partial entries on disk so later appends stay aligned
+            with open(vectors_file, "r+b") as f:
+                f.truncate(n * dim * 4)
+            with open(answers_file, "r+b") as f:
+                f.truncate(ends[n - 1] if n else 0)
+
+        self._indexes[namespace] = [index, answers]
+        return self._indexes[namespace]
+
+    def _encode(self, text: str):
+        import numpy as np
+
+        # Normalized embeddings make the dot product equal to cosine similarity
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def get(self, text: str, namespace: str) -> Optional[str]:
+        """
+        Return the answer of the most similar cached text, or None if nothing is similar enough
+        """
+        index, answers = self._load(namespace)
+        if index is None:
+            return None
+
+        sims = index @ self._encode(text)
+        i = int(sims.argmax())
+        if sims[i] > self.threshold:
+            return answers[i]
+        return None
+
+    def add(self, text: str, answer: str, namespace: str):
+        """
+        Add a text and its answer to the index
+        """
+        import numpy as np
+
+        entry = self._load(namespace)
+        vector = self._encode(text)
+        entry[0] = vector[np.newaxis, :] if entry[0] is None else np.vstack([entry[0], vector])
+        entry[1].append(answer)
+
+        # Append only the new entry instead of rewriting the whole index
+        os.makedirs(self.cache_dir, exist_ok=True)
+        vectors_file, answers_file = self._files(namespace)
+        with open(vectors_file, "ab") as f:
+            f.write(vector.tobytes())
+        with open(answers_file, "ab") as f:
+            f.write(orjson.dumps(answer) + b"\n")
+
+class CodeExplainerBot:
+    def __init__(self, api_key: str, max_concurrency: int = 10, batch_size: int = 5, io_workers: int = 8,
+                 max_requests_per_minute: Optional[int] = None,
+                 max_tokens_per_minute: Optional[int] = None,
+                 cache_dir: str = "data/.llm_cache",
+                 semantic_cache: bool = False,
+                 model: str = "gpt-4o-mini"):
+        """
+        Initialize the code explanation bot
+
+        Parameters:
+        api_key: OpenAI API key
+        max_concurrency: Maximum number of API requests in flight during batch processing
+        batch_size: Number of files packed into one API request during batch processing
+        io_workers: Number of threads reading files during batch processing
+        max_requests_per_minute: Request rate limit (read from the API when not given)
+        max_tokens_per_minute: Token rate limit (read from the API when not given)
+        cache_dir: Directory for cached explanations
+        semantic_cache: Also reuse explanations of similar errors (needs sentence-transformers)
+        model: OpenAI chat model used for explanations
+        """
+        self.api_key = api_key
+        self.client = _get_client(api_key)
+        # Async client, only open while async work runs (see _aclient_session)
+        self.aclient = None
+        self._aclient_users = 0
+        self._limiter_lock = None
+        self.max_concurrency = max_concurrency
+        self.batch_size = max(1, batch_size)
+        self.io_workers = io_workers
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.request_limiter = None
+        self.token_limiter = None
+        self.cache = LLMCache(cache_dir)
+        self.semantic_cache = SemanticCache(cache_dir) if semantic_cache else None
+
+        # Model settings
+        self.model = model
+        self.temperature = 0.7
+        self.max_tokens = 800  # upper bound, see _max_tokens_for
+
+        self.system_prompt = SYSTEM_PROMPT
+
+    def _build_user_prompt(self, error_code: str, error_message: str = "") -> str:
+        """
+        Build the user prompt sent to the model for one piece of code
+        """
+        return _USER_PROMPT_HEAD + error_code + _USER_PROMPT_TAIL + error_message + _FMT_BLOCK
+
+    def _build_batch_prompt(self, items: List[Tuple[str, str]]) -> str:
+        """
+        Build one user prompt covering several (filename, code) samples
+        """
+        parts = [
+            f"Analyze the following {len(items)} Python code samples and return a JSON object "
+            '{"results": [...]} with one object per sample with the fields "filename" and "analysis".\n'
+            f"Write each analysis in Markdown using the following format:\n{ANSWER_FORMAT}"
+        ]
+        for i, (filename, code) in enumerate(items, 1):
+            parts.append(f"\nSample {i}: {filename}\n```python\n{code}\n```\n")
+        return "".join(parts)
+
+    @staticmethod
+    def _parse_batch_response(content: str, items: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """
+        Map a batched JSON response back to the samples, None for samples the model skipped
+        """
+        try:
+            results = orjson.loads(content).get("results", [])
+            # Only well-formed entries count; anything else falls back to a single request
+            by_filename = {
+                r["filename"]: r["analysis"]
+                for r in results
+                if isinstance(r, dict) and isinstance(r.get("filename"), str) and isinstance(r.get("analysis"), str)
+            }
+        except (ValueError, AttributeError, TypeError):
+            by_filename = {}
+        return [by_filename.get(filename) for filename, _ in items]
+
+    def _max_tokens_for(self, code: str) -> int:
+        """
+        Completion budget for one piece of code
+
+        Short samples get short answers, and a smaller budget reserves less of the
+        tokens-per-minute limit.
+        """
+        return min(self.max_tokens, 200 + 5 * code.count("\n"))
+
+    def _settings_key(self) -> str:
+        # Semantic cache entries and resumed manifest rows are only reused with the same model settings
+        return LLMCache.cache_key({"m": self.model, "s": self.system_prompt, "t": self.temperature})[:16]
+
+    def _cache_key(self, user_prompt: str) -> str:
+        return LLMCache.cache_key({
+            "m": self.model,
+            "s": self.system_prompt,
+            "u": user_prompt,
+            "t": self.temperature
+        })
+
+    def _use_cache(self, force_cache: bool) -> bool:
+        # Sampled responses are only reused when explicitly requested
+        return self.temperature == 0 or force_cache
+
+    def _lookup_cache(self, error_code: str, error_message: str, user_prompt: str) -> Optional[str]:
+        """
+        Look up an explanation in the exact cache, then in the semantic cache
+        """
+        cached = self.cache.get(self._cache_key(user_prompt))
+        if cached is None and self.semantic_cache is not None:
+            cached = self.semantic_cache.get(error_code + "\n" + error_message, self._settings_key())
+        return cached
+
+    def _store_cache(self, error_code: str, error_message: str, user_prompt: str, explanation: str):
+        self.cache.set(self._cache_key(user_prompt), explanation)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(error_code + "\n" + error_message, explanation, self._settings_key())
+
+    def explain_error(self, error_code: str, error_message: str = "", force_cache: bool = False,
+                      stream: bool = False) -> str:
         """
         Explain code errors
        
         Parameters:
         error_code: Code with errors
         error_message: Error message (optional)
+        force_cache: Cache the response even though temperature > 0
+        stream: Print the explanation to stdout while it is generated (Ctrl-C stops generation)
        
         Returns:
-        Explanation text
+        Explanation text (an APIErrorText if the API call failed)
         """
-        user_prompt = f"""
-Please analyze the following Python code error:
+        user_prompt = self._build_user_prompt(error_code, error_message)
 
-Code:
-```python
-{error_code}
-```
+        use_cache = self._use_cache(force_cache)
+        if use_cache:
+            cached = self._lookup_cache(error_code, error_message, user_prompt)
+            if cached is not None:
+                if stream:
+                    print(cached)
+                return cached
 
-Error message (if any):
-{error_message}
+        try:
+            max_tokens = self._max_tokens_for(error_code)
 
-Please answer in the following format:
+            if stream:
+                explanation, complete = self._stream_completion(user_prompt, max_tokens)
+                # A stopped generation is incomplete, so it is not cached
+                use_cache = use_cache and complete
+            else:
+                response = self._call(user_prompt, max_tokens)
+                explanation = response.choices[0].message.content
 
-## Error Analysis
-[Explain what the error is]
+            if use_cache:
+                self._store_cache(error_code, error_message, user_prompt, explanation)
+            return explanation
+            
+        except Exception as e:
+            error_text = APIErrorText.from_exception(e)
+            if stream:
+                print(error_text)
+            return error_text
 
-## Cause
-[Explain why this error occurred]
+    def _stream_completion(self, user_prompt: str, max_tokens: int) -> Tuple[str, bool]:
+        """
+        Stream a completion to stdout
 
-## Repair Suggestions
-[Provide conceptual repair methods, do not give complete code]
+        Returns:
+        The generated text and whether generation finished (False if stopped with Ctrl-C)
+        """
+        response = self._call(user_prompt, max_tokens, stream=True)
 
-## Learning Points
-[Relevant Python knowledge points]
-"""
+        buf = []
+        try:
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    sys.stdout.write(delta)
+                    sys.stdout.flush()
+                    buf.append(delta)
+        except KeyboardInterrupt:
+            # Close the connection so the server stops generating
+            response.close()
+            print("\n⏹️ Generation stopped")
+            return "".join(buf), False
+
+        print()
+        return "".join(buf), True
+
+    async def explain_error_async(self, error_code: str, error_message: str = "", force_cache: bool = False) -> str:
+        """
+        Explain code errors without blocking other requests (used for batch processing)
+
+        Parameters:
+        error_code: Code with errors
+        error_message: Error message (optional)
+        force_cache: Cache the response even though temperature > 0
+
+        Returns:
+        Explanation text (an APIErrorText if the API call failed)
+        """
+        user_prompt = self._build_user_prompt(error_code, error_message)
+
+        use_cache = self._use_cache(force_cache)
+        if use_cache:
+            cached = self._lookup_cache(error_code, error_message, user_prompt)
+            if cached is not None:
+                return cached
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",  
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,  
-                max_tokens=800
-            )
-            
-            return response.choices[0].message.content
-            
+            response = await self._acall(user_prompt, self._max_tokens_for(error_code))
+            explanation = response.choices[0].message.content
+
+            if use_cache:
+                self._store_cache(error_code, error_message, user_prompt, explanation)
+            return explanation
+
         except Exception as e:
-            return f"API call error: {str(e)}"
-       
-    def process_error_files(self, input_folder: str, output_file: str):
+            return APIErrorText.from_exception(e)
+
+    def explain_errors_batch(self, items: List[Tuple[str, str]], force_cache: bool = False) -> List[str]:
+        """
+        Explain several code files with a single API request
+
+        Synchronous wrapper around explain_errors_batch_async; do not call it from
+        inside a running event loop.
+
+        Parameters:
+        items: List of (filename, code) pairs
+        force_cache: Cache the responses even though temperature > 0
+
+        Returns:
+        Explanation text for each item, in the same order
+        """
+        return asyncio.run(self.explain_errors_batch_async(items, force_cache=force_cache))
+
+    async def explain_errors_batch_async(self, items: List[Tuple[str, str]], force_cache: bool = False) -> List[str]:
+        """
+        Explain several code files with a single API request without blocking other requests
+
+        Parameters:
+        items: List of (filename, code) pairs
+        force_cache: Cache the responses even though temperature > 0
+
+        Returns:
+        Explanation text for each item, in the same order
+        """
+        explanations, pending = self._batch_cache_lookup(items, force_cache)
+        if len(pending) == 1:
+            i = pending[0]
+            explanations[i] = await self.explain_error_async(items[i][1], force_cache=force_cache)
+        elif pending:
+            batch = [items[i] for i in pending]
+            try:
+                response = await self._acall(
+                    self._build_batch_prompt(batch),
+                    sum(self._max_tokens_for(code) for _, code in batch),
+                    response_format={"type": "json_object"}
+                )
+                answers = self._parse_batch_response(response.choices[0].message.content, batch)
+                missing = self._store_batch_answers(items, pending, answers, explanations, force_cache)
+            except Exception as e:
+                for i in pending:
+                    explanations[i] = APIErrorText.from_exception(e)
+                missing = []
+
+            # Fall back to a single request for samples missing from the batched answer
+            for i in missing:
+                explanations[i] = await self.explain_error_async(items[i][1], force_cache=force_cache)
+
+        return explanations
+
+    def _batch_cache_lookup(self, items: List[Tuple[str, str]], force_cache: bool):
+        """
+        Fill in cached explanations and return the indexes that still need an API call
+        """
+        explanations = [None] * len(items)
+        pending = []
+        for i, (_, code) in enumerate(items):
+            if self._use_cache(force_cache):
+                explanations[i] = self._lookup_cache(code, "", self._build_user_prompt(code))
+            if explanations[i] is None:
+                pending.append(i)
+        return explanations, pending
+
+    def _store_batch_answers(self, items: List[Tuple[str, str]], pending: List[int],
+                             answers: List[Optional[str]], explanations: List[Optional[str]],
+                             force_cache: bool) -> List[int]:
+        """
+        Put batched answers in place and cache them; return the indexes the model skipped
+
+        Answers are cached under the single-file prompt so later single or batched runs reuse them.
+        """
+        missing = []
+        for i, answer in zip(pending, answers):
+            if answer is None:
+                missing.append(i)
+                continue
+            explanations[i] = answer
+            if self._use_cache(force_cache):
+                code = items[i][1]
+                self._store_cache(code, "", self._build_user_prompt(code), answer)
+        return missing
+
+    def _messages(self, user_prompt: str) -> List[Dict]:
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    @_api_retry
+    def _call(self, user_prompt: str, max_tokens: int, **kwargs):
+        """
+        Send one chat completion request, retrying transient failures
+        """
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(user_prompt),
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+
+    @contextlib.asynccontextmanager
+    async def _aclient_session(self):
+        """
+        Keep an AsyncOpenAI client open for the current event loop
+
+        Its pooled connections belong to the loop that opened them, and every
+        asyncio.run starts a new loop, so the client is created by the first user
+        inside a loop and closed when the last one is done.
+        """
+        if self._aclient_users == 0:
+            import openai
+
+            # Retries are handled by _api_retry only, so each attempt passes the rate limiters
+            self.aclient = openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
+            # Lets concurrent first requests share a single rate-limit probe
+            self._limiter_lock = asyncio.Lock()
+        self._aclient_users += 1
+        try:
+            yield self.aclient
+        finally:
+            self._aclient_users -= 1
+            if self._aclient_users == 0:
+                aclient, self.aclient = self.aclient, None
+                await aclient.close()
+
+    @_api_retry
+    async def _acall(self, user_prompt: str, max_tokens: int, **kwargs):
+        """
+        Send one chat completion request through the rate limiters, retrying transient failures
+
+        Every attempt spends credits again, so retries are throttled like new requests.
+        """
+        async with self._aclient_session() as aclient:
+            await self._init_rate_limiters()
+            # Rough token estimate: ~4 characters per prompt token plus the completion budget
+            cost = (len(self.system_prompt) + len(user_prompt)) // 4 + max_tokens
+
+            def create():
+                return aclient.chat.completions.create(
+                    model=self.model,
+                    messages=self._messages(user_prompt),
+                    temperature=self.temperature,
+                    max_tokens=max_tokens,
+                    **kwargs
+                )
+
+            return await self.request_limiter.transact(
+                lambda: self.token_limiter.transact(create, credits=cost, refund_time=60),
+                credits=1,
+                refund_time=60
+            )
+
+    async def _init_rate_limiters(self):
+        """
+        Create the request and token limiters, probing the account limits if they were not given
+
+        Must run inside _aclient_session, since the probe uses the open async client.
+        """
+        if self.request_limiter is not None:
+            return
+
+        async with self._limiter_lock:
+            if self.request_limiter is None:
+                await self._probe_rate_limits()
+
+    async def _probe_rate_limits(self):
+        requests_per_minute = self.max_requests_per_minute
+        tokens_per_minute = self.max_tokens_per_minute
+
+        if requests_per_minute is None or tokens_per_minute is None:
+            # A 1-token request returns the account limits in its response headers
+            try:
+                raw = await self.aclient.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": "hi"}],
+                    max_tokens=1
+                )
+                headers = raw.headers
+            except Exception as e:
+                print(f"Could not read rate limits, using defaults: {e}")
+                headers = {}
+
+            if requests_per_minute is None:
+                requests_per_minute = int(headers.get("x-ratelimit-limit-requests", DEFAULT_REQUESTS_PER_MINUTE))
+            if tokens_per_minute is None:
+                tokens_per_minute = int(headers.get("x-ratelimit-limit-tokens", DEFAULT_TOKENS_PER_MINUTE))
+
+        self.request_limiter = CreditSemaphore(requests_per_minute)
+        self.token_limiter = CreditSemaphore(tokens_per_minute)
+
+    def process_error_files(self, input_folder: str, output_file: str, force_cache: bool = False):
         """
         Batch process error code files
+
+        Report sections are written as soon as each group of files is explained.
+        Every result is also appended to a JSONL manifest next to the report
+        (<output_file without extension>.jsonl). Rerunning skips files whose code
+        is unchanged since they were explained successfully with the same model
+        settings, so an interrupted run can be resumed without paying for finished
+        files again.
        
         Parameters:
         input_folder: Path to folder containing error code files
         output_file: Path to output markdown file
+        force_cache: Reuse cached explanations even though temperature > 0
         """
-        explanations = []
-
         # check if the input folder exists
         if not os.path.exists(input_folder):
             print(f"Error: Input folder '{input_folder}' does not exist")
             return
 
-        # Traverse Python files in the folder
-        for filename in os.listdir(input_folder):  
-            if filename.endswith('.py'):
-                file_path = os.path.join(input_folder, filename)
+        # Validate files before any API call is made
+        py_files = self._scan_input_folder(input_folder)
+        if not py_files:
+            print("No Python files found or processed successfully")
+            return
+
+        # make sure output folder exists
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        manifest_file = os.path.splitext(output_file)[0] + ".jsonl"
 
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        code_content = f.read()
-
-                    print(f"Analyzing {filename}...")
-                    explanation = self.explain_error(code_content)  
-
-                    explanations.append({
-                        'filename': filename,
-                        'code': code_content,
-                        'explanation': explanation  
-                    })
-               
-                except Exception as e:
-                    print(f"Error processing file {filename}: {e}")
+        cases = asyncio.run(self._process_error_files_async(py_files, output_file, manifest_file, force_cache))
 
-        if explanations:
-            # Generate markdown report
-            self._generate_markdown_report(explanations, output_file)
+        if cases:
             print(f"Analysis complete! Result saved to {output_file}")
         else:
             print("No Python files found or processed successfully")
 
-    def _generate_markdown_report(self, explanations: List[Dict], output_file: str):
+    @staticmethod
+    def _scan_input_folder(input_folder: str) -> List[Tuple[str, str]]:
         """
-        Generate markdown format report
+        List the Python files worth sending to the API
+
+        Returns:
+        Sorted (filename, path) pairs of non-empty .py files up to MAX_SOURCE_BYTES
         """
-        # make sure output file exists
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write("# Python Code Error Explanation Report\n\n")  
-            f.write("---\n\n")
-            
-            for i, item in enumerate(explanations, 1):  
-                f.write(f"## Case {i}: {item['filename']}\n\n")
-                f.write("### Original Code\n")
-                f.write("```python\n")
-                f.write(item['code'])
-                f.write("\n```\n\n")
-                f.write("### AI Assistant Explanation\n")
-                f.write(item['explanation'])  
-                f.write("\n\n---\n\n")
+        py_files = []
+        # Sorted so runs process files in a deterministic order
+        for entry in sorted(os.scandir(input_folder), key=lambda e: e.name):
+            if not (entry.is_file() and entry.name.endswith('.py')):
+                continue
 
-def create_sample_error_files():
-    """
-    Create sample error code files for testing
-    """
-    error_samples = {
-        "syntax_error.py": '''
+            size = entry.stat().st_size
+            if size == 0:
+                print(f"Skipping {entry.name}: file is empty")
+            elif size > MAX_SOURCE_BYTES:
+                print(f"Skipping {entry.name}: file is larger than {MAX_SOURCE_BYTES} bytes")
+            else:
+                py_files.append((entry.name, entry.path))
+
+        return py_files
+
+    @staticmethod
+    def _read_manifest(manifest_file: str):
+        """
+        Yield (offset, row) for each row of a results manifest, skipping a line left incomplete by a crash
+        """
+        if not os.path.exists(manifest_file):
+            return
+        with open(manifest_file, "rb") as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    yield offset, orjson.loads(line)
+                except ValueError:
+                    continue
+
+    @staticmethod
+    def _manifest_row(manifest_file: str, offset: int) -> Dict:
+        with open(manifest_file, "rb") as f:
+            f.seek(offset)
+            return orjson.loads(f.readline())
+
+    @staticmethod
+    def _code_hash(code: str) -> str:
+        return hashlib.sha256(code.encode()).hexdigest()
+
+    async def _process_error_files_async(self, py_files: List[Tuple[str, str]], output_file: str,
+                                         manifest_file: str, force_cache: bool = False) -> int:
+        """
+        Read the Python files, explain them concurrently and stream the report
+
+        At most (io_workers + max_concurrency) * batch_size file contents are held at
+        once. Per file, only the resume index entry (a code hash and a manifest offset)
+        and the explanation in the LLM cache's memory layer are kept for the whole run.
+
+        Parameters:
+        py_files: (filename, path) pairs of the files to analyze
+        output_file: Path to output markdown file
+        manifest_file: JSONL file that results are appended to
+        force_cache: Reuse cached explanations even though temperature > 0
+
+        Returns:
+        Number of cases written to the report
+        """
+        # Files explained successfully in earlier runs with the current model settings:
+        # hash of their code and manifest offset
+        settings = self._settings_key()
+        done = {}
+        for offset, row in self._read_manifest(manifest_file):
+            if row.get("settings") != settings:
+                continue
+            if row.get("error"):
+                done.pop(row["filename"], None)
+            else:
+                done[row["filename"]] = (self._code_hash(row["code"]), offset)
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        sink = asyncio.ensure_future(self._sink(queue, output_file))
+
+        # One async client shared by all requests of this run, closed before the loop ends
+        async with self._aclient_session():
+            with ThreadPoolExecutor(max_workers=self.io_workers) as io_pool, \
+                    open(manifest_file, "ab", buffering=0) as manifest:
+                # Reads run at most a few groups ahead of the API calls, so only a bounded
+                # number of files is held in memory however large the folder is
+                reads = asyncio.Queue(maxsize=self.io_workers * self.batch_size)
+                producer = asyncio.ensure_future(self._read_files(loop, io_pool, py_files, reads))
+                # Each worker packs several files into a request, limiting the requests in flight
+                workers = [
+                    asyncio.ensure_future(self._worker(reads, manifest, done, queue, settings, force_cache))
+                    for _ in range(self.max_concurrency)
+                ]
+                try:
+                    await asyncio.gather(producer, *workers)
+                finally:
+                    for task in [producer, *workers]:
+                        task.cancel()
+                    await asyncio.gather(producer, *workers, return_exceptions=True)
+                    # Let the sink finish writing whatever was queued
+                    await queue.put(None)
+                    cases = await sink
+
+        return cases
+
+    async def _read_files(self, loop: asyncio.AbstractEventLoop, io_pool: ThreadPoolExecutor,
+                          py_files: List[Tuple[str, str]], reads: asyncio.Queue):
+        """
+        Start reading the files in the IO pool and queue (filename, future) pairs for the workers
+
+        Blocks while the queue is full, then sends one None per worker when all files are queued.
+        """
+        for filename, file_path in py_files:
+            read = functools.partial(Path(file_path).read_text, encoding="utf-8")
+            await reads.put((filename, loop.run_in_executor(io_pool, read)))
+
+        for _ in range(self.max_concurrency):
+            await reads.put(None)
+
+    async def _worker(self, reads: asyncio.Queue, manifest, done: Dict[str, Tuple[str, int]],
+                      queue: asyncio.Queue, settings: str, force_cache: bool = False):
+        """
+        Take read files from the queue and explain them in groups of up to batch_size until None is received
+
+        Results are appended to the manifest and queued for the report writer.
+        """
+        finished = False
+        while not finished:
+            group = []
+            while len(group) < self.batch_size:
+                item = await reads.get()
+                if item is None:
+                    finished = True
+                    break
+
+                filename, read = item
+                try:
+                    code_content = await read
+                except Exception as e:
+                    print(f"Error processing file {filename}: {e}")
+                    continue
+
+                if not code_content.strip():
+                    print(f"Skipping {filename}: file has no code")
+                    continue
+
+                previous = done.get(filename)
+                if previous is not None and previous[0] == self._code_hash(code_content):
+                    print(f"Skipping {filename} (already analyzed)")
+                    await queue.put(self._manifest_row(manifest.name, previous[1]))
+                else:
+                    group.append((filename, code_content))
+
+            if not group:
+                continue
+
+            for filename, _ in group:
+                print(f"Analyzing {filename}...")
+            explanations = await self.explain_errors_batch_async(group, force_cache=force_cache)
+
+            # Writes happen between awaits, so lines from concurrent groups never interleave
+            for (filename, code_content), explanation in zip(group, explanations):
+                row = {
+                    'filename': filename,
+                    'code': code_content,
+                    'explanation': explanation,
+                    'error': isinstance(explanation, APIErrorText),
+                    'settings': settings
+                }
+                manifest.write(orjson.dumps(row) + b"\n")
+                await queue.put(row)
+
+    async def _sink(self, queue: asyncio.Queue, output_file: str) -> int:
+        """
+        Write report cases as they arrive on the queue until None is received
+
+        Returns:
+        Number of cases written
+        """
+        f = None
+        case = 0
+        try:
+            while True:
+                row = await queue.get()
+                if row is None:
+                    break
+
+                # Only create the report once there is something to put in it
+                if f is None:
+                    f = open(output_file, "w", encoding="utf-8")
+                    f.write("# Python Code Error Explanation Report\n\n---\n\n")
+
+                case += 1
+                f.write(self._render_case(case, row))
+        finally:
+            if f is not None:
+                f.close()
+
+        return case
+
+    @staticmethod
+    def _render_case(case: int, row: Dict) -> str:
+        """
+        Render one report case in markdown
+        """
+        return "".join([
+            f"## Case {case}: {row['filename']}\n\n",
+            "### Original Code\n",
+            "```python\n",
+            row['code'],
+            "\n```\n\n",
+            "### AI Assistant Explanation\n",
+            row['explanation'],
+            "\n\n---\n\n"
+        ])
+
+# Sample error code files used for practice and testing
+SAMPLE_ERROR_FILES = {
+    "syntax_error.py": '''
 # Syntax error example
 def greet(name):
     print("Hello, " + name)
@@ -162,7 +1034,7 @@ def greet(name):
         print("Special greeting!")
 ''',
 
-        "variable_error.py": '''
+    "variable_error.py": '''
 # Variable error example
 def calculate_area():
     # Using undefined variables
@@ -173,7 +1045,7 @@ result = calculate_area()
 print(result)            
 ''',
 
-        "type_error.py": '''
+    "type_error.py": '''
 # Type error example
 def add_numbers(a, b):
     return a + b
@@ -183,7 +1055,7 @@ result = add_numbers("5", 7)
 print(result)
 ''',
 
-        "index_error.py": '''
+    "index_error.py": '''
 # Index error example
 numbers = [1, 2, 3, 4, 5]
 
@@ -191,8 +1063,8 @@ numbers = [1, 2, 3, 4, 5]
 for i in range(10):
     print(numbers[i])  
 ''',
-               
-        "logic_error.py": '''
+
+    "logic_error.py": '''
 # Logic error example
 def find_maximum(numbers):
     max_num = 0  # Logic error: what if all numbers are negative?
@@ -206,18 +1078,52 @@ negative_numbers = [-5, -2, -8, -1]
 result = find_maximum(negative_numbers)
 print(f"Maximum: {result}")  # Will incorrectly return 0
 '''
-    }
+}
 
+def create_sample_error_files():
+    """
+    Create sample error code files for testing
+    """
     # Create data directory and error_codes subdirectory
-    os.makedirs("data/error_codes", exist_ok=True)
-    
-    for filename, content in error_samples.items():
-        file_path = f"data/error_codes/{filename}"
-        with open(file_path, 'w', encoding="utf-8") as f:
-            f.write(content.strip())
-    
+    base = Path("data/error_codes")
+    base.mkdir(parents=True, exist_ok=True)
+
+    for filename, content in SAMPLE_ERROR_FILES.items():
+        (base / filename).write_text(content.strip(), encoding="utf-8")
+
     print("Sample error code files created in data/error_codes/ directory")
 
+def create_sample_error_zip(zip_path: str = "data/error_codes.zip") -> str:
+    """
+    Write all sample error code files into one uncompressed zip archive
+
+    Useful as a test fixture: one file on disk instead of one per sample.
+
+    Parameters:
+    zip_path: Path of the archive to create
+
+    Returns:
+    Path of the created archive
+    """
+    import zipfile
+
+    os.makedirs(os.path.dirname(zip_path) or ".", exist_ok=True)
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for filename, content in SAMPLE_ERROR_FILES.items():
+            zf.writestr(filename, content.strip())
+
+    return zip_path
+
+@functools.lru_cache(maxsize=1)
+def _loaded_env() -> bool:
+    """
+    Load the .env file once per process
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return True
+
 def load_api_key():
     """
     Load API key from environment variables
@@ -227,7 +1133,7 @@ def load_api_key():
     str: API key
     """
     # Load .env file
-    load_dotenv()
+    _loaded_env()
 
     # Try to get the API key from environment variables
     api_key = os.getenv('OPENAI_API_KEY')
@@ -288,11 +1194,11 @@ def main():
             error_msg = input("\nError message (optional, press Enter to skip): ").strip()
 
             print("\n🔍 Analyzing...")
-            explanation = bot.explain_error(error_code, error_msg)
             print("\n" + "=" * 50)
             print("🤖 AI Assistant Explanation:")
             print("=" * 50)
-            print(explanation)
+            # Print the explanation as it is generated
+            bot.explain_error(error_code, error_msg, stream=True)
 
         elif mode == "2":
             # Batch analysis mode